@@ -12,8 +12,110 @@ import subprocess
 import shutil
 import argparse
 import re
+import json
+import hashlib
+import glob
+import tempfile
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
 from pathlib import Path
-from typing import List, Tuple, Dict, Optional
+from functools import lru_cache
+from typing import List, Tuple, Dict, Optional, Iterator, NamedTuple, Set, Iterable
+
+try:
+    from fontTools.subset import Options, Subsetter, load_font, save_font, parse_unicodes
+    from fontTools.ttLib import TTFont
+except ImportError:
+    # 缺少 fonttools 时由 check_dependencies 给出安装提示
+    Options = Subsetter = load_font = save_font = parse_unicodes = TTFont = None
+
+# 屏蔽 fontTools 子集化过程中的警告（如无法子集化的表被丢弃），避免与进度输出混在一起
+logging.getLogger("fontTools.subset").setLevel(logging.ERROR)
+
+# HarfBuzz 子集化后端（C++ 实现，比纯 Python 的 fontTools 快得多）
+# 优先使用 uharfbuzz 绑定，其次使用 hb-subset 命令，都不可用时回退到 fontTools
+try:
+    import uharfbuzz as hb
+except ImportError:
+    hb = None
+
+HB_SUBSET_PATH = shutil.which("hb-subset")
+
+# 支持的字体扩展名（str.endswith 可直接接受元组）
+SOURCE_FONT_EXTENSIONS = ('.ttf', '.otf', '.woff')
+FONT_EXTENSIONS = SOURCE_FONT_EXTENSIONS + ('.woff2',)
+
+# Unicode 子集划分（名称 -> 范围）
+UNICODE_SUBSETS = {
+    'latin': 'U+0020-007F',      # 基本拉丁字符
+    'latin-ext': 'U+00A0-00FF',  # Latin-1 补充
+    'punct': 'U+2000-206F',      # 常用标点
+    'supsub': 'U+2070-209F',     # 上标和下标
+    'currency': 'U+20A0-20CF',   # 货币符号
+}
+
+# 各压缩级别保留的 Unicode 子集
+LEVEL_SUBSETS = {
+    'basic': ['latin', 'latin-ext', 'punct', 'supsub', 'currency'],
+    'medium': ['latin', 'latin-ext', 'punct'],
+    'aggressive': ['latin'],
+}
+
+# 内容文件路径模式中的花括号展开，如 *.{html,vue}
+BRACE_RE = re.compile(r'\{([^{}]*)\}')
+
+# 工作进程启动时预先加载的字体表模块（fontTools 在首次用到某个表时才导入对应模块）
+WARMUP_TABLE_TAGS = ('head', 'hhea', 'maxp', 'OS/2', 'post', 'loca', 'glyf', 'CFF ', 'gasp', 'cvt ', 'fpgm', 'prep')
+
+# 交互式选择压缩级别时的输入与级别对应关系
+LEVEL_CHOICES = {'1': 'basic', '2': 'medium', '3': 'aggressive'}
+
+# 非交互环境（如 CI）未指定压缩级别时使用的默认级别
+DEFAULT_LEVEL = 'basic'
+
+# 增量压缩缓存文件名（保存在字体目录下）
+CACHE_FILE_NAME = '.font_compressor_cache.json'
+
+# 文件大小单位（除数, 单位名）
+FILE_SIZE_UNITS = [(1, 'B'), (1024, 'KB'), (1024 ** 2, 'MB'), (1024 ** 3, 'GB'), (1024 ** 4, 'TB')]
+
+# 字重映射
+FONT_WEIGHTS = {
+    'thin': (100, 'Thin'),
+    'extralight': (200, 'ExtraLight'),
+    'light': (300, 'Light'),
+    'regular': (400, 'Regular'),
+    'normal': (400, 'Regular'),
+    'medium': (500, 'Medium'),
+    'semibold': (600, 'SemiBold'),
+    'bold': (700, 'Bold'),
+    'extrabold': (800, 'ExtraBold'),
+    'black': (900, 'Black'),
+    'heavy': (900, 'Heavy'),
+}
+
+# 预编译的字重/斜体匹配规则（长名称优先，避免 ExtraBold 被识别为 Bold）
+WEIGHT_RE = re.compile(
+    r'[-_]?(' + '|'.join(sorted(FONT_WEIGHTS, key=len, reverse=True)) + ')',
+    re.IGNORECASE
+)
+ITALIC_RE = re.compile(r'[-_]?italic', re.IGNORECASE)
+
+# CSS 输出模板
+CSS_HEADER = '/* 自动生成的字体文件 */\n/* 由 font_compressor.py 生成 */\n'
+CSS_FAMILY_TEMPLATE = '\n/* {family} 字体家族 */\n'
+CSS_UNICODE_RANGE_TEMPLATE = '  unicode-range: {unicode_range};\n'
+CSS_FONT_FACE_TEMPLATE = """
+/* {family} {label} */
+@font-face {{
+  font-family: '{family}';
+  src: url('{path}') format('woff2');
+  font-weight: {weight};
+  font-style: {style};
+  font-display: swap;
+{unicode_range}}}
+"""
 
 def check_dependencies():
     """检查必要的依赖是否已安装"""
@@ -31,12 +133,10 @@ def check_dependencies():
     except ImportError:
         missing_packages.append('brotli')
     
-    # 检查 pyftsubset 命令是否可用
+    # 检查 fontTools 子集化模块是否可用（在进程内调用，无需启动 pyftsubset）
     try:
-        result = subprocess.run(['pyftsubset', '--help'], capture_output=True, text=True)
-        if result.returncode != 0:
-            missing_packages.append('fonttools[subset]')
-    except FileNotFoundError:
+        from fontTools.subset import Subsetter
+    except ImportError:
         if 'fonttools' not in missing_packages:
             missing_packages.append('fonttools[subset]')
     
@@ -54,157 +154,315 @@ def get_file_size(file_path: str) -> int:
 
 def format_file_size(size_bytes: int) -> str:
     """格式化文件大小显示"""
-    if size_bytes < 1024:
+    # 每 10 个二进制位对应一级单位，直接由位长度查表
+    index = min(max(0, (size_bytes.bit_length() - 1) // 10), len(FILE_SIZE_UNITS) - 1)
+    if index == 0:
         return f"{size_bytes} B"
-    elif size_bytes < 1024 * 1024:
-        return f"{size_bytes / 1024:.2f} KB"
+    divisor, unit = FILE_SIZE_UNITS[index]
+    return f"{size_bytes / divisor:.2f} {unit}"
+
+def build_subset_options(compression_level: str = "basic") -> Tuple["Options", str]:
+    """
+    根据压缩级别构建子集化选项（与 pyftsubset 命令行参数一一对应）
+    
+    Args:
+        compression_level: 压缩级别 ("basic", "medium", "aggressive")
+    
+    Returns:
+        (Options, unicodes): 子集化选项和需要保留的 Unicode 范围
+    """
+    options = Options()
+    options.flavor = "woff2"     # 输出为 WOFF2 格式，压缩率更高
+    options.with_zopfli = True   # 使用 Zopfli 算法进一步压缩
+    options.notdef_glyph = True  # 保留 .notdef 字形
+    options.hinting = False      # 移除 TrueType 微调指令，网页渲染不需要
+    
+    # 根据压缩级别设置不同的参数
+    if compression_level == "basic":
+        # 基础压缩：保留常用字符和功能
+        options.layout_features = ["*"]     # 保留所有布局特性
+        options.glyph_names = True          # 保留字形名称
+        options.symbol_cmap = True          # 保留符号映射
+        options.legacy_cmap = True          # 保留传统字符映射
+        options.recommended_glyphs = True   # 保留推荐字形
+        options.name_IDs = ["*"]            # 保留所有名称ID
+        options.name_legacy = True          # 保留传统名称
+    elif compression_level == "medium":
+        # 中等压缩：移除一些不常用的功能
+        options.layout_features = ["kern", "liga", "clig"]  # 只保留关键布局特性
+        options.glyph_names = False         # 移除字形名称
+        options.name_IDs = [1, 2, 3, 4, 5, 6]  # 只保留基本名称ID
+    else:  # aggressive
+        # 激进压缩：最大程度减小文件大小
+        options.layout_features = []        # 移除所有布局特性
+        options.glyph_names = False         # 移除字形名称
+        options.symbol_cmap = False         # 移除符号映射
+        options.legacy_cmap = False         # 移除传统映射
+        options.name_IDs = [1, 2]           # 只保留最基本的名称
+        options.desubroutinize = True       # 去子程序化（可能减小CFF字体大小）
+        options.drop_tables += [     # 移除网页渲染用不到的表
+            "DSIG", "LTSH", "VDMX", "hdmx", "prep", "FFTM",
+            "EBLC", "EBDT", "morx", "mort", "vhea", "vmtx",
+        ]
+    
+    unicodes = ",".join(UNICODE_SUBSETS[name] for name in get_level_subsets(compression_level))
+    return options, unicodes
+
+def get_level_subsets(compression_level: str) -> List[str]:
+    """返回压缩级别保留的 Unicode 子集名称（基础级别保留最多，激进级别只保留基本ASCII字符）"""
+    return LEVEL_SUBSETS.get(compression_level, LEVEL_SUBSETS["aggressive"])
+
+def get_subset_backend() -> str:
+    """返回当前使用的子集化后端名称"""
+    if hb is not None:
+        return "uharfbuzz"
+    if HB_SUBSET_PATH:
+        return "hb-subset"
+    return "fonttools"
+
+def _hb_tag(tag: str) -> int:
+    """将 OpenType 表/特性标签转换为 HarfBuzz 使用的整数形式"""
+    return int.from_bytes(tag.ljust(4).encode("ascii"), "big")
+
+def _hb_fill_set(hb_set, values: list, convert=int):
+    """按 fontTools 选项的语义填充 HarfBuzz 集合（'*' 表示全部保留）"""
+    hb_set.clear()
+    if "*" in values:
+        hb_set.invert()
     else:
-        return f"{size_bytes / (1024 * 1024):.2f} MB"
+        hb_set.update(convert(v) for v in values)
 
-def compress_font(input_path: str, output_path: str, compression_level: str = "basic") -> bool:
+def _read_sfnt(input_path: str) -> bytes:
+    """读取字体文件的 SFNT 数据（HarfBuzz 不支持 WOFF/WOFF2，需要先解包）"""
+    with open(input_path, "rb") as f:
+        data = f.read()
+    
+    if data[:4] in (b"wOFF", b"wOF2"):
+        font = TTFont(BytesIO(data), recalcTimestamp=False)
+        try:
+            font.flavor = None
+            buffer = BytesIO()
+            font.save(buffer, reorderTables=False)
+            data = buffer.getvalue()
+        finally:
+            font.close()
+    
+    return data
+
+def load_hb_face(input_path: str, subset_count: int = 1):
+    """
+    加载供 uharfbuzz 子集化使用的字体 face
+    
+    同一源字体需要生成多个子集时先执行 subset_preprocess，之后每次子集化都可复用
+    （CFF 字体收益最大）；只生成一个子集时预处理本身的开销可能超过收益，直接返回普通 face
+    
+    Args:
+        input_path: 输入字体文件路径
+        subset_count: 将从该字体生成的子集数量
+    
+    Returns:
+        HarfBuzz face，uharfbuzz 不可用时返回 None
+    """
+    if hb is None:
+        return None
+    
+    face = hb.Face(_read_sfnt(input_path))
+    if subset_count >= 2:
+        face = hb.subset_preprocess(face)
+    return face
+
+def _subset_with_uharfbuzz(face, options: "Options", unicodes: str) -> bytes:
+    """使用 uharfbuzz 在进程内完成子集化，返回子集化后的 SFNT 数据"""
+    subset_input = hb.SubsetInput()
+    subset_input.unicode_set.update(parse_unicodes(unicodes))
+    _hb_fill_set(subset_input.layout_feature_tag_set, options.layout_features, _hb_tag)
+    _hb_fill_set(subset_input.name_id_set, options.name_IDs)
+    subset_input.drop_table_tag_set.update(_hb_tag(t) for t in options.drop_tables)
+    
+    flags = hb.SubsetFlags.DEFAULT
+    if options.glyph_names:
+        flags |= hb.SubsetFlags.GLYPH_NAMES
+    if options.name_legacy:
+        flags |= hb.SubsetFlags.NAME_LEGACY
+    if options.desubroutinize:
+        flags |= hb.SubsetFlags.DESUBROUTINIZE
+    if not options.hinting:
+        flags |= hb.SubsetFlags.NO_HINTING
+    subset_input.flags = flags
+    
+    new_face = hb.subset(face, subset_input)
+    if new_face is None:
+        raise RuntimeError("HarfBuzz 子集化失败")
+    return new_face.blob.data
+
+def _subset_with_hb_subset(data: bytes, options: "Options", unicodes: str) -> bytes:
+    """调用 hb-subset 命令完成子集化，返回子集化后的 SFNT 数据"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        temp_input = os.path.join(temp_dir, "source.ttf")
+        temp_output = os.path.join(temp_dir, "subset.ttf")
+        with open(temp_input, "wb") as f:
+            f.write(data)
+        
+        args = [
+            HB_SUBSET_PATH, temp_input,
+            "--output-file=" + temp_output,
+            "--unicodes=" + unicodes,
+            "--layout-features=" + ",".join(options.layout_features),
+            "--name-IDs=" + ",".join(str(i) for i in options.name_IDs),
+            "--drop-tables+=" + ",".join(options.drop_tables),
+        ]
+        if options.glyph_names:
+            args.append("--glyph-names")
+        if options.name_legacy:
+            args.append("--name-legacy")
+        if options.desubroutinize:
+            args.append("--desubroutinize")
+        if not options.hinting:
+            args.append("--no-hinting")
+        
+        # 只在失败时解码错误输出
+        result = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.decode("utf-8", "replace"))
+        
+        with open(temp_output, "rb") as f:
+            return f.read()
+
+def _subset_font(input_path: str, output_path: str, compression_level: str = "basic",
+                 hb_face=None, unicodes: Optional[str] = None):
+    """执行子集化并输出 WOFF2，出错时直接抛出异常（参数同 compress_font）"""
+    options, level_unicodes = build_subset_options(compression_level)
+    if unicodes is None:
+        unicodes = level_unicodes
+    backend = get_subset_backend()
+    
+    if backend == "fonttools":
+        font = load_font(input_path, options, dontLoadGlyphNames=not options.glyph_names)
+        try:
+            subsetter = Subsetter(options=options)
+            subsetter.populate(unicodes=parse_unicodes(unicodes))
+            subsetter.subset(font)
+            save_font(font, output_path, options)
+        finally:
+            font.close()
+        return
+    
+    if backend == "uharfbuzz":
+        face = hb_face if hb_face is not None else load_hb_face(input_path)
+        data = _subset_with_uharfbuzz(face, options, unicodes)
+    else:
+        data = _subset_with_hb_subset(_read_sfnt(input_path), options, unicodes)
+    
+    # HarfBuzz 只输出 SFNT，由 fontTools 封装为 WOFF2
+    font = TTFont(BytesIO(data), recalcTimestamp=False)
+    try:
+        save_font(font, output_path, options)
+    finally:
+        font.close()
+
+def compress_font(input_path: str, output_path: str, compression_level: str = "basic",
+                  hb_face=None, unicodes: Optional[str] = None) -> bool:
     """
     压缩单个字体文件
     
+    优先使用 HarfBuzz 完成子集化，再由 fontTools 封装为 WOFF2；
+    HarfBuzz 不可用时直接在当前进程内调用 fontTools 的 Subsetter
+    
     Args:
         input_path: 输入字体文件路径
         output_path: 输出字体文件路径
         compression_level: 压缩级别 ("basic", "medium", "aggressive")
+        hb_face: 由 load_hb_face 预先加载的 face，同一源字体生成多个子集时传入以复用
+        unicodes: 需要保留的 Unicode 范围，默认使用压缩级别对应的范围
     
     Returns:
         bool: 压缩是否成功
     """
     try:
-        # 基础压缩参数
-        base_args = [
-            "pyftsubset", input_path,
-            "--output-file=" + output_path,
-            "--flavor=woff2",  # 输出为 WOFF2 格式，压缩率更高
-            "--with-zopfli",   # 使用 Zopfli 算法进一步压缩
-        ]
-        
-        # 根据压缩级别设置不同的参数
-        if compression_level == "basic":
-            # 基础压缩：保留常用字符和功能
-            args = base_args + [
-                "--unicodes=U+0020-007F,U+00A0-00FF,U+2000-206F,U+2070-209F,U+20A0-20CF",  # 基本拉丁字符、标点符号等
-                "--layout-features=*",  # 保留所有布局特性
-                "--glyph-names",        # 保留字形名称
-                "--symbol-cmap",        # 保留符号映射
-                "--legacy-cmap",        # 保留传统字符映射
-                "--notdef-glyph",       # 保留 .notdef 字形
-                "--recommended-glyphs", # 保留推荐字形
-                "--name-IDs=*",         # 保留所有名称ID
-                "--name-legacy",        # 保留传统名称
-            ]
-        elif compression_level == "medium":
-            # 中等压缩：移除一些不常用的功能
-            args = base_args + [
-                "--unicodes=U+0020-007F,U+00A0-00FF,U+2000-206F",  # 减少字符范围
-                "--layout-features=kern,liga,clig",  # 只保留关键布局特性
-                "--no-glyph-names",     # 移除字形名称
-                "--notdef-glyph",
-                "--name-IDs=1,2,3,4,5,6",  # 只保留基本名称ID
-            ]
-        else:  # aggressive
-            # 激进压缩：最大程度减小文件大小
-            args = base_args + [
-                "--unicodes=U+0020-007F",  # 只保留基本ASCII字符
-                "--no-layout-features",     # 移除所有布局特性
-                "--no-glyph-names",        # 移除字形名称
-                "--no-symbol-cmap",        # 移除符号映射
-                "--no-legacy-cmap",        # 移除传统映射
-                "--notdef-glyph",
-                "--name-IDs=1,2",          # 只保留最基本的名称
-                "--desubroutinize",        # 去子程序化（可能减小CFF字体大小）
-            ]
-        
-        # 执行压缩命令
-        result = subprocess.run(args, capture_output=True, text=True)
-        
-        if result.returncode == 0:
-            return True
-        else:
-            print(f"压缩失败: {result.stderr}")
-            return False
+        _subset_font(input_path, output_path, compression_level, hb_face=hb_face, unicodes=unicodes)
+        return True
             
     except Exception as e:
         print(f"压缩过程中出现错误: {str(e)}")
         return False
 
+def _iter_font_entries(directory: str, extensions: Tuple[str, ...]) -> Iterator[os.DirEntry]:
+    """递归遍历目录，逐个返回匹配扩展名的字体文件条目"""
+    try:
+        entries = os.scandir(directory)
+    except OSError:
+        # 与 os.walk 一致，忽略无法访问的目录
+        return
+    
+    with entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _iter_font_entries(entry.path, extensions)
+            elif entry.name.lower().endswith(extensions):
+                yield entry
+
 def find_font_files(directory: str, exclude_woff2: bool = False) -> List[str]:
     """查找目录中的所有字体文件"""
-    if exclude_woff2:
-        font_extensions = ['.ttf', '.otf', '.woff']
-    else:
-        font_extensions = ['.ttf', '.otf', '.woff', '.woff2']
-    font_files = []
-    
-    for root, dirs, files in os.walk(directory):
-        for file in files:
-            if any(file.lower().endswith(ext) for ext in font_extensions):
-                font_files.append(os.path.join(root, file))
-    
-    return font_files
+    extensions = SOURCE_FONT_EXTENSIONS if exclude_woff2 else FONT_EXTENSIONS
+    return [entry.path for entry in _iter_font_entries(directory, extensions)]
+
+class FontInfo(NamedTuple):
+    """从字体文件名解析出的字体信息"""
+    family: str
+    weight: int
+    style: str
+    weight_name: str
+    full_name: str
 
-def parse_font_info(filename: str) -> Dict[str, any]:
+@lru_cache(maxsize=None)
+def parse_font_info(filename: str) -> FontInfo:
     """
     从字体文件名解析字体信息（字重、样式等）
     
+    结果只取决于文件名，因此按文件名缓存
+    
     Args:
         filename: 字体文件名（不含路径）
     
     Returns:
-        包含字体信息的字典
+        FontInfo: 字体信息（不可变，可安全缓存）
     """
     # 移除扩展名
     name_without_ext = os.path.splitext(filename)[0]
     
-    # 字重映射
-    weight_mapping = {
-        'thin': (100, 'Thin'),
-        'extralight': (200, 'ExtraLight'),
-        'light': (300, 'Light'),
-        'regular': (400, 'Regular'),
-        'normal': (400, 'Regular'),
-        'medium': (500, 'Medium'),
-        'semibold': (600, 'SemiBold'),
-        'bold': (700, 'Bold'),
-        'extrabold': (800, 'ExtraBold'),
-        'black': (900, 'Black'),
-        'heavy': (900, 'Heavy'),
-    }
-    
-    # 默认值
-    font_weight = 400
-    font_style = 'normal'
-    weight_name = 'Regular'
+    # 检查字重（默认 Regular）
+    match = WEIGHT_RE.search(name_without_ext)
+    font_weight, weight_name = FONT_WEIGHTS[match.group(1).lower()] if match else (400, 'Regular')
     
     # 检查是否为斜体
-    if re.search(r'italic', name_without_ext, re.IGNORECASE):
-        font_style = 'italic'
-    
-    # 检查字重
-    name_lower = name_without_ext.lower()
-    for weight_key, (weight_value, weight_label) in weight_mapping.items():
-        if weight_key in name_lower:
-            font_weight = weight_value
-            weight_name = weight_label
-            break
+    font_style = 'italic' if ITALIC_RE.search(name_without_ext) else 'normal'
     
     # 提取字体家族名称（移除字重和样式后缀）
-    family_name = name_without_ext
-    for weight_key, (_, weight_label) in weight_mapping.items():
-        family_name = re.sub(r'[-_]?' + weight_label, '', family_name, flags=re.IGNORECASE)
-    family_name = re.sub(r'[-_]?italic', '', family_name, flags=re.IGNORECASE)
-    family_name = family_name.strip('-_')
-    
-    return {
-        'family': family_name,
-        'weight': font_weight,
-        'style': font_style,
-        'weight_name': weight_name,
-        'full_name': name_without_ext
-    }
+    family_name = ITALIC_RE.sub('', WEIGHT_RE.sub('', name_without_ext)).strip('-_')
+    
+    return FontInfo(
+        family=family_name,
+        weight=font_weight,
+        style=font_style,
+        weight_name=weight_name,
+        full_name=name_without_ext
+    )
+
+def split_subset_name(filename: str) -> Tuple[str, Optional[str]]:
+    """
+    从拆分输出的文件名中分离出子集名
+    
+    例如 Foo-Bold.latin.woff2 -> ('Foo-Bold.woff2', 'latin')，非子集文件返回 (filename, None)
+    """
+    stem, ext = os.path.splitext(filename)
+    base, dot, subset = stem.rpartition('.')
+    if dot and subset in UNICODE_SUBSETS:
+        return base + ext, subset
+    return filename, None
+
+def _subset_order(subset: Optional[str]) -> int:
+    """子集在 UNICODE_SUBSETS 中的顺序，非子集文件排在最前"""
+    return list(UNICODE_SUBSETS).index(subset) if subset else -1
 
 def generate_css(font_files: List[str], output_css_path: str, css_base_path: str):
     """
@@ -216,19 +474,18 @@ def generate_css(font_files: List[str], output_css_path: str, css_base_path: str
         css_base_path: CSS文件相对于字体文件的基础路径
     """
     # 按字体家族分组
-    font_groups: Dict[str, List[Dict]] = {}
+    font_groups: Dict[str, List[Tuple[FontInfo, str, Optional[str]]]] = {}
+    
+    # CSS 文件所在目录只需计算一次
+    css_dir = os.path.dirname(os.path.abspath(output_css_path))
     
     for font_file in font_files:
         if not font_file.endswith('.woff2'):
             continue
             
-        filename = os.path.basename(font_file)
+        filename, subset = split_subset_name(os.path.basename(font_file))
         font_info = parse_font_info(filename)
         
-        # 计算相对路径
-        font_dir = os.path.dirname(font_file)
-        css_dir = os.path.dirname(output_css_path)
-        
         try:
             # 计算从CSS文件到字体文件的相对路径
             rel_path = os.path.relpath(font_file, css_dir)
@@ -238,49 +495,233 @@ def generate_css(font_files: List[str], output_css_path: str, css_base_path: str
             # 如果在不同驱动器上，使用绝对路径
             rel_path = font_file.replace('\\', '/')
         
-        font_info['path'] = rel_path
-        
-        family = font_info['family']
+        family = font_info.family
         if family not in font_groups:
             font_groups[family] = []
-        font_groups[family].append(font_info)
-    
-    # 生成CSS内容
-    css_lines = ['/* 自动生成的字体文件 */', '/* 由 font_compressor.py 生成 */', '']
+        font_groups[family].append((font_info, rel_path, subset))
     
-    for family, fonts in sorted(font_groups.items()):
-        css_lines.append(f'/* {family} 字体家族 */')
-        css_lines.append('')
+    # 逐段写入CSS文件，不在内存中拼接完整内容
+    with open(output_css_path, 'w', encoding='utf-8', buffering=1 << 16) as f:
+        f.write(CSS_HEADER)
         
-        # 按字重排序
-        fonts.sort(key=lambda x: (x['weight'], x['style']))
-        
-        for font in fonts:
-            css_lines.append(f"/* {family} {font['weight_name']}{' Italic' if font['style'] == 'italic' else ''} */")
-            css_lines.append('@font-face {')
-            css_lines.append(f"  font-family: '{family}';")
-            css_lines.append(f"  src: url('{font['path']}') format('woff2');")
-            css_lines.append(f"  font-weight: {font['weight']};")
-            css_lines.append(f"  font-style: {font['style']};")
-            css_lines.append('  font-display: swap;')
-            css_lines.append('}')
-            css_lines.append('')
-    
-    # 写入CSS文件
-    with open(output_css_path, 'w', encoding='utf-8') as f:
-        f.write('\n'.join(css_lines))
+        for family, fonts in sorted(font_groups.items()):
+            f.write(CSS_FAMILY_TEMPLATE.format(family=family))
+            
+            # 按字重排序，同一字重的子集按 UNICODE_SUBSETS 中的顺序排列
+            fonts.sort(key=lambda x: (x[0].weight, x[0].style, _subset_order(x[2])))
+            
+            for font, path, subset in fonts:
+                label = font.weight_name + (' Italic' if font.style == 'italic' else '')
+                f.write(CSS_FONT_FACE_TEMPLATE.format(
+                    family=family,
+                    label=f"{label} ({subset})" if subset else label,
+                    path=path,
+                    weight=font.weight,
+                    style=font.style,
+                    unicode_range=CSS_UNICODE_RANGE_TEMPLATE.format(
+                        unicode_range=UNICODE_SUBSETS[subset].replace(',', ', ')
+                    ) if subset else '',
+                ))
     
     print(f"[OK] CSS文件已生成: {output_css_path}")
     print(f"  包含 {sum(len(fonts) for fonts in font_groups.values())} 个字体定义")
     print(f"  字体家族: {', '.join(sorted(font_groups.keys()))}")
 
-def compress_fonts_batch(font_directory: str, compression_level: str = "basic") -> List[str]:
+def _expand_braces(pattern: str) -> List[str]:
+    """展开路径模式中的花括号，如 **/*.{html,vue} -> **/*.html、**/*.vue"""
+    match = BRACE_RE.search(pattern)
+    if not match:
+        return [pattern]
+    
+    expanded = []
+    for alternative in match.group(1).split(','):
+        expanded.extend(_expand_braces(pattern[:match.start()] + alternative + pattern[match.end():]))
+    return expanded
+
+def collect_content_codepoints(patterns: List[str], base_dir: str) -> Tuple[Set[int], int]:
+    """
+    扫描站点内容文件，收集实际用到的字符
+    
+    Args:
+        patterns: 内容文件路径模式列表（支持 ** 和 {a,b}，相对路径基于 base_dir）
+        base_dir: 相对路径模式的基准目录
+    
+    Returns:
+        (codepoints, file_count): 用到的字符码位集合和扫描的文件数量
+    """
+    files = set()
+    for pattern in patterns:
+        for expanded in _expand_braces(pattern):
+            if not os.path.isabs(expanded):
+                expanded = os.path.join(base_dir, expanded)
+            files.update(path for path in glob.iglob(expanded, recursive=True) if os.path.isfile(path))
+    
+    chars: Set[str] = set()
+    for path in files:
+        try:
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                chars |= set(f.read())
+        except OSError as e:
+            print(f"警告: 无法读取内容文件 {path}: {str(e)}")
+    
+    # 忽略换行、制表符等控制字符
+    return {ord(c) for c in chars if ord(c) >= 0x20}, len(files)
+
+def format_unicodes(codepoints: Iterable[int]) -> str:
+    """将码位集合格式化为紧凑的 Unicode 范围字符串，如 U+0020-007E,U+4E2D"""
+    ranges = []
+    for codepoint in sorted(codepoints):
+        if ranges and codepoint == ranges[-1][1] + 1:
+            ranges[-1][1] = codepoint
+        else:
+            ranges.append([codepoint, codepoint])
+    
+    return ",".join(
+        f"U+{start:04X}" if start == end else f"U+{start:04X}-{end:04X}"
+        for start, end in ranges
+    )
+
+def get_output_path(font_file: str, subset: Optional[str] = None) -> str:
+    """生成输出文件名（保持原文件名，只改变扩展名；拆分子集时在扩展名前加上子集名）"""
+    base_name = os.path.splitext(font_file)[0]
+    return f"{base_name}.{subset}.woff2" if subset else f"{base_name}.woff2"
+
+def get_output_jobs(font_file: str, compression_level: str, split_subsets: bool = False,
+                    content_unicodes: Optional[str] = None) -> List[Tuple[str, Optional[str]]]:
+    """
+    列出一个源字体需要生成的输出文件
+    
+    Args:
+        font_file: 输入字体文件路径
+        compression_level: 压缩级别
+        split_subsets: 是否按 Unicode 子集拆分为多个输出文件
+        content_unicodes: 站点内容实际用到的字符范围，指定时代替压缩级别对应的范围
+    
+    Returns:
+        (output_file, unicodes) 列表；unicodes 为 None 时使用压缩级别对应的完整范围
+    """
+    if not split_subsets:
+        return [(get_output_path(font_file), content_unicodes)]
+    
+    content_codepoints = set(parse_unicodes(content_unicodes)) if content_unicodes else None
+    jobs = []
+    for subset in get_level_subsets(compression_level):
+        unicodes = UNICODE_SUBSETS[subset]
+        if content_codepoints is not None:
+            # 只保留该子集中内容实际用到的字符，未用到的子集不再生成
+            used = content_codepoints.intersection(parse_unicodes(unicodes))
+            if not used:
+                continue
+            unicodes = format_unicodes(used)
+        jobs.append((get_output_path(font_file, subset), unicodes))
+    return jobs
+
+def _outputs_signature(output_files: List[str]) -> Optional[Tuple[str, int]]:
+    """
+    返回输出文件的修改时间和大小组成的签名及总大小
+    
+    任一输出文件不存在时返回 None
+    """
+    parts = []
+    total_size = 0
+    for output_file in output_files:
+        try:
+            stat = os.stat(output_file)
+        except FileNotFoundError:
+            return None
+        parts.append(f"{stat.st_mtime_ns}:{stat.st_size}")
+        total_size += stat.st_size
+    return ";".join(parts), total_size
+
+def _options_fingerprint(compression_level: str) -> str:
+    """压缩级别对应的子集化后端和选项摘要，选项调整后缓存随之失效"""
+    options, unicodes = build_subset_options(compression_level)
+    return f"{get_subset_backend()}|{unicodes}|{sorted(vars(options).items())!r}"
+
+def _source_cache_key(entry: os.DirEntry, options_fingerprint: str, split_subsets: bool,
+                      content_unicodes: Optional[str]) -> str:
+    """根据源文件路径、修改时间、大小、子集化选项、是否拆分子集和内容字符范围生成缓存键"""
+    stat = entry.stat()
+    raw = (f"{entry.path}|{stat.st_mtime_ns}|{stat.st_size}|{options_fingerprint}|{split_subsets}|"
+           f"{content_unicodes or ''}")
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+def load_compress_cache(cache_path: str) -> Dict[str, str]:
+    """读取增量压缩缓存（源文件缓存键 -> 输出文件签名），读取失败时返回空缓存"""
+    try:
+        with open(cache_path, "r", encoding="utf-8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return cache if isinstance(cache, dict) else {}
+
+def save_compress_cache(cache_path: str, cache: Dict[str, str]):
+    """写入增量压缩缓存"""
+    try:
+        with open(cache_path, "w", encoding="utf-8") as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+    except OSError as e:
+        print(f"警告: 无法写入缓存文件 {cache_path}: {str(e)}")
+
+def _init_worker():
+    """工作进程初始化：预先导入 WOFF2 编码器和常用字体表模块，之后的每个任务都无需再导入"""
+    if TTFont is None:
+        return
+    
+    from fontTools.ttLib import getTableModule, woff2  # noqa: F401  woff2 会同时导入 brotli
+    for tag in WARMUP_TABLE_TAGS:
+        getTableModule(tag)
+
+def _process_one(font_file: str, original_size: int, compression_level: str, split_subsets: bool = False,
+                 content_unicodes: Optional[str] = None) -> Tuple[List[str], int, Optional[Tuple[str, int]], Optional[str]]:
+    """
+    压缩单个字体文件并统计大小（在工作进程中执行）
+    
+    错误信息随结果返回，由主进程打印在对应文件的进度信息下方，避免多个工作进程的输出交错
+    
+    Args:
+        font_file: 输入字体文件路径
+        original_size: 原始文件大小（由扫描目录时的 stat 结果提供，避免重复 stat）
+        compression_level: 压缩级别
+        split_subsets: 是否按 Unicode 子集拆分为多个输出文件
+        content_unicodes: 站点内容实际用到的字符范围
+    
+    Returns:
+        (output_files, original_size, signature, error): 输出文件路径列表、原始大小、
+        输出文件签名及总大小（输出文件未全部生成时为 None）以及错误信息（成功时为 None）
+    """
+    jobs = get_output_jobs(font_file, compression_level, split_subsets, content_unicodes)
+    output_files = [output_file for output_file, _ in jobs]
+    if not jobs:
+        return output_files, original_size, None, None
+    
+    try:
+        # 同一源字体生成多个子集时复用预处理后的 face
+        hb_face = load_hb_face(font_file, len(jobs))
+        
+        # 压缩字体
+        for output_file, unicodes in jobs:
+            _subset_font(font_file, output_file, compression_level, hb_face=hb_face, unicodes=unicodes)
+    except Exception as e:
+        return output_files, original_size, None, str(e)
+    
+    return output_files, original_size, _outputs_signature(output_files), None
+
+def compress_fonts_batch(font_directory: str, compression_level: str = "basic",
+                         use_cache: bool = True, split_subsets: bool = False,
+                         content_unicodes: Optional[str] = None) -> List[str]:
     """
     批量压缩字体文件
     
+    源文件和压缩级别都未变化且输出文件未被改动时跳过该文件，
+    判断依据记录在字体目录下的 .font_compressor_cache.json 中
+    
     Args:
         font_directory: 字体文件目录
         compression_level: 压缩级别
+        use_cache: 是否跳过未变化的字体（False 时强制重新压缩全部文件）
+        split_subsets: 是否按 Unicode 子集拆分输出（如 Foo.latin.woff2、Foo.punct.woff2）
+        content_unicodes: 站点内容实际用到的字符范围，指定时只保留这些字符
     
     Returns:
         生成的woff2文件路径列表
@@ -289,15 +730,18 @@ def compress_fonts_batch(font_directory: str, compression_level: str = "basic")
         print(f"错误: 目录 {font_directory} 不存在")
         return []
     
-    # 查找所有字体文件（排除已经是woff2的）
-    font_files = find_font_files(font_directory, exclude_woff2=True)
+    # 查找所有字体文件（排除已经是woff2的），保留目录条目以复用其 stat 信息
+    font_entries = list(_iter_font_entries(font_directory, SOURCE_FONT_EXTENSIONS))
     
-    if not font_files:
+    if not font_entries:
         print("未找到字体文件")
         return []
     
-    print(f"找到 {len(font_files)} 个字体文件")
+    print(f"找到 {len(font_entries)} 个字体文件")
     print(f"压缩级别: {compression_level}")
+    print(f"子集化后端: {get_subset_backend()}")
+    if split_subsets:
+        print(f"按 Unicode 子集拆分输出: {', '.join(get_level_subsets(compression_level))}")
     print(f"压缩后的文件将与源文件放在同一目录，扩展名为 .woff2")
     print("-" * 60)
     
@@ -306,42 +750,89 @@ def compress_fonts_batch(font_directory: str, compression_level: str = "basic")
     successful_compressions = 0
     generated_woff2_files = []
     
-    for i, font_file in enumerate(font_files, 1):
-        print(f"[{i}/{len(font_files)}] 处理: {os.path.basename(font_file)}")
+    cache_path = os.path.join(font_directory, CACHE_FILE_NAME)
+    old_cache = load_compress_cache(cache_path) if use_cache else {}
+    new_cache: Dict[str, str] = {}
+    options_fingerprint = _options_fingerprint(compression_level)
+    
+    # 跳过源文件和输出文件都未变化的字体
+    pending_entries = []
+    source_keys: Dict[str, str] = {}
+    unused_fonts = 0
+    for entry in font_entries:
+        source_key = _source_cache_key(entry, options_fingerprint, split_subsets, content_unicodes)
+        jobs = get_output_jobs(entry.path, compression_level, split_subsets, content_unicodes)
+        
+        if not jobs:
+            # 内容未用到该字体的任何子集，无需生成文件
+            unused_fonts += 1
+            new_cache[source_key] = _outputs_signature([])[0]
+            continue
         
-        # 获取原始文件大小
-        original_size = get_file_size(font_file)
-        total_original_size += original_size
+        output_files = [output_file for output_file, _ in jobs]
+        signature = _outputs_signature(output_files)
         
-        # 生成输出文件名（保持原文件名，只改变扩展名）
-        file_dir = os.path.dirname(font_file)
-        base_name = os.path.splitext(os.path.basename(font_file))[0]
-        output_file = os.path.join(file_dir, f"{base_name}.woff2")
+        if signature is None or old_cache.get(source_key) != signature[0]:
+            source_keys[entry.path] = source_key
+            pending_entries.append(entry)
+            continue
         
-        # 压缩字体
-        if compress_font(font_file, output_file, compression_level):
-            if os.path.exists(output_file):
-                compressed_size = get_file_size(output_file)
+        output_signature, compressed_size = signature
+        new_cache[source_key] = output_signature
+        total_original_size += entry.stat().st_size
+        total_compressed_size += compressed_size
+        successful_compressions += 1
+        generated_woff2_files.extend(output_files)
+    
+    if successful_compressions:
+        print(f"跳过 {successful_compressions} 个未变化的字体文件")
+    if unused_fonts:
+        print(f"跳过 {unused_fonts} 个字体文件（内容未用到任何子集，无需生成）")
+    if successful_compressions or unused_fonts:
+        print()
+    
+    # 各字体文件相互独立且为 CPU 密集型任务，使用多进程并行压缩
+    with ProcessPoolExecutor(initializer=_init_worker) as executor:
+        futures = {
+            executor.submit(_process_one, entry.path, entry.stat().st_size,
+                            compression_level, split_subsets, content_unicodes): entry.path
+            for entry in pending_entries
+        }
+        
+        for i, future in enumerate(as_completed(futures), 1):
+            font_file = futures[future]
+            print(f"[{i}/{len(pending_entries)}] 处理: {os.path.basename(font_file)}")
+            
+            output_files, original_size, signature, error = future.result()
+            total_original_size += original_size
+            
+            if error is not None:
+                print(f"  [失败] 压缩过程出错: {error}")
+            elif signature is None:
+                print(f"  [失败] 输出文件未生成")
+            else:
+                output_signature, compressed_size = signature
                 total_compressed_size += compressed_size
                 successful_compressions += 1
-                generated_woff2_files.append(output_file)
+                generated_woff2_files.extend(output_files)
+                new_cache[source_keys[font_file]] = output_signature
                 
                 # 计算压缩率
                 compression_ratio = (1 - compressed_size / original_size) * 100
                 
                 print(f"  [OK] 成功: {format_file_size(original_size)} -> {format_file_size(compressed_size)} "
                       f"(压缩 {compression_ratio:.1f}%)")
-            else:
-                print(f"  [失败] 输出文件未生成")
-        else:
-            print(f"  [失败] 压缩过程出错")
-        
-        print()
+            
+            print()
+    
+    save_compress_cache(cache_path, new_cache)
     
     # 显示总结
     print("=" * 60)
     print("压缩完成!")
-    print(f"成功压缩: {successful_compressions}/{len(font_files)} 个文件")
+    print(f"成功压缩: {successful_compressions}/{len(font_entries) - unused_fonts} 个文件")
+    if unused_fonts:
+        print(f"无需生成: {unused_fonts} 个文件（内容未用到任何子集）")
     
     if successful_compressions > 0:
         total_compression_ratio = (1 - total_compressed_size / total_original_size) * 100
@@ -364,6 +855,9 @@ def main():
   %(prog)s Monocraft -l basic                       # 使用基础压缩级别
   %(prog)s Monocraft -l basic -c monocraft.css      # 压缩并生成CSS文件
   %(prog)s /path/to/fonts -l medium -c fonts.css    # 使用绝对路径
+  %(prog)s Monocraft -l basic -f                    # 忽略缓存，强制重新压缩
+  %(prog)s Monocraft -l basic -s -c monocraft.css   # 按 Unicode 子集拆分并生成 unicode-range
+  %(prog)s HarmonyOS -l basic --content "../../**/*.{html,vue,ts,tsx,md}"  # 只保留站点内容用到的字符
   
 压缩级别说明:
   basic      - 基础压缩：保留大部分功能，适合网页使用
@@ -372,6 +866,7 @@ def main():
 
 CSS生成说明:
   使用 -c/--css 选项生成CSS文件，自动使用相对路径引用字体文件
+  配合 -s/--split 时每个子集生成一条带 unicode-range 的 @font-face，浏览器只下载页面用到的子集
         '''
     )
     
@@ -395,6 +890,26 @@ CSS生成说明:
         help='生成CSS文件路径（相对于脚本位置或绝对路径）'
     )
     
+    parser.add_argument(
+        '-s', '--split',
+        action='store_true',
+        help='按 Unicode 子集拆分为多个 WOFF2 文件，并在CSS中生成对应的 unicode-range'
+    )
+    
+    parser.add_argument(
+        '--content',
+        action='append',
+        default=None,
+        metavar='PATTERN',
+        help='只保留站点内容实际用到的字符，PATTERN 为内容文件路径模式（支持 ** 和 {a,b}，可多次指定）'
+    )
+    
+    parser.add_argument(
+        '-f', '--force',
+        action='store_true',
+        help='忽略增量缓存，强制重新压缩所有字体文件'
+    )
+    
     parser.add_argument(
         '--version',
         action='version',
@@ -436,6 +951,11 @@ CSS生成说明:
     # 确定压缩级别
     compression_level = args.level
     
+    if compression_level is None and not sys.stdin.isatty():
+        # 非交互环境无法输入，直接使用默认级别
+        compression_level = DEFAULT_LEVEL
+        print(f"\n未指定压缩级别，使用默认级别: {compression_level}")
+    
     if compression_level is None:
         # 交互式选择压缩级别
         print("\n请选择压缩级别:")
@@ -443,23 +963,32 @@ CSS生成说明:
         print("2. 中等压缩 (平衡文件大小和功能)")
         print("3. 激进压缩 (最小文件大小，可能影响显示效果)")
         
-        while True:
-            choice = input("\n请输入选择 (1-3): ").strip()
-            if choice == "1":
-                compression_level = "basic"
+        while compression_level is None:
+            try:
+                choice = input("\n请输入选择 (1-3): ").strip()
+            except EOFError:
+                # 输入流已结束，使用默认级别
+                compression_level = DEFAULT_LEVEL
                 break
-            elif choice == "2":
-                compression_level = "medium"
-                break
-            elif choice == "3":
-                compression_level = "aggressive"
-                break
-            else:
+            compression_level = LEVEL_CHOICES.get(choice)
+            if compression_level is None:
                 print("无效选择，请输入 1、2 或 3")
     
+    # 收集站点内容实际用到的字符
+    content_unicodes = None
+    if args.content:
+        codepoints, file_count = collect_content_codepoints(args.content, script_dir)
+        print(f"\n从 {file_count} 个内容文件中收集到 {len(codepoints)} 个字符")
+        if codepoints:
+            content_unicodes = format_unicodes(codepoints)
+        else:
+            print("警告: 未收集到任何字符，使用压缩级别对应的字符范围")
+    
     # 开始批量压缩
     print()
-    generated_files = compress_fonts_batch(font_directory, compression_level=compression_level)
+    generated_files = compress_fonts_batch(font_directory, compression_level=compression_level,
+                                           use_cache=not args.force, split_subsets=args.split,
+                                           content_unicodes=content_unicodes)
     
     # 生成CSS文件
     if args.css and generated_files:
@@ -483,7 +1012,7 @@ CSS生成说明:
         # 生成CSS
         generate_css(generated_files, css_path, script_dir)
     elif args.css and not generated_files:
-        print("\n警告: 没有成功生成WOFF2文件，跳过CSS生成")
+        print("\n警告: 没有生成任何WOFF2文件，跳过CSS生成")
     
     print()
     print("=" * 60)